@@ -0,0 +1,40 @@
+"""Shared helpers for the benchmark scripts."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'cocktails_bench.db')}"
+
+
+def make_cocktail(i):
+    return {
+        "name": f"Cocktail {i:07d}",
+        "description": "A benchmark cocktail with a moderately long description",
+        "ingredients": "Gin, Campari, Sweet vermouth, Orange peel",
+        "instructions": "Stir all ingredients with ice. Strain into a glass. Garnish with orange peel.",
+    }
+
+
+def seed(rows):
+    """Replace the contents of the cocktails table with `rows` synthetic cocktails."""
+    from main import CocktailDB, SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(CocktailDB).delete()
+        for start in range(0, rows, 10000):
+            db.bulk_insert_mappings(CocktailDB, [make_cocktail(i) for i in range(start, min(start + 10000, rows))])
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
@@ -0,0 +1,65 @@
+"""Bytes on the wire and CPU cost of response compression per endpoint and encoding.
+
+Each endpoint is requested in-process with every supported Accept-Encoding. Wire bytes are
+the raw (still encoded) body; CPU is the process time per request and the part of it spent
+in the compressors, for the first request and averaged over all of them (later requests
+reuse already-compressed bodies where the response has an ETag).
+
+Usage:
+    python bench/compression.py --rows 10000 --requests 20
+"""
+import argparse
+import json
+import time
+
+import common  # noqa: F401  (puts the app on sys.path)
+from common import seed
+from fastapi.testclient import TestClient
+
+import main
+
+PATHS = ["/api/cocktails?limit=1000", "/api/cocktails/catalog", "/api/cocktails/export"]
+
+
+def compression_cpu():
+    return sum(h.snapshot()["sum"] for h in main.compression_cpu.children.values())
+
+
+def measure(client, path, encoding, requests):
+    main.compressed_cache.clear()
+    wire, cpu, compress_cpu = 0, [], []
+    for _ in range(requests):
+        start, start_compress = time.process_time(), compression_cpu()
+        with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+            wire = sum(len(chunk) for chunk in response.iter_raw())
+        cpu.append(time.process_time() - start)
+        compress_cpu.append(compression_cpu() - start_compress)
+    return {
+        "wire_bytes": wire,
+        "cpu_ms_per_request": round(sum(cpu) / requests * 1000, 2),
+        "compress_cpu_ms_first": round(compress_cpu[0] * 1000, 2),
+        "compress_cpu_ms_per_request": round(sum(compress_cpu) / requests * 1000, 2),
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    results = {"rows": args.rows, "encodings": list(main.COMPRESS_ENCODINGS), "paths": {}}
+    with TestClient(main.app) as client:
+        for path in PATHS:
+            by_encoding = {enc: measure(client, path, enc, args.requests)
+                           for enc in ("identity",) + main.COMPRESS_ENCODINGS}
+            identity = by_encoding["identity"]["wire_bytes"]
+            for numbers in by_encoding.values():
+                numbers["ratio"] = round(identity / max(numbers["wire_bytes"], 1), 1)
+            results["paths"][path] = by_encoding
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,87 @@
+"""Load-test the sync and async request paths at high concurrency.
+
+Starts one uvicorn process per mode (DB_ASYNC=false/true) against the same database and
+drives it over HTTP with a fixed number of concurrent clients.
+
+Usage:
+    DATABASE_URL=postgresql://... python bench/concurrency.py --rows 10000 --concurrency 200
+
+The async mode uses asyncpg for Postgres, or aiosqlite for the SQLite stand-in (both in requirements.txt).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+from common import ROOT, percentile, seed
+
+
+async def drive(base_url, names, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                path = f"/api/cocktails/{random.choice(names)}" if random.random() < 0.8 else "/api/cocktails?limit=20"
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    errors += response.status_code != 200
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_mode(mode, args, names):
+    env = dict(os.environ, DB_ASYNC=mode, CACHE_MAX_ENTRIES="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        latencies, errors = asyncio.run(drive(base_url, names, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "mode": "async" if mode == "true" else "sync",
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    names = [f"Cocktail {i:07d}" for i in range(args.rows)]
+    print(json.dumps([run_mode(mode, args, names) for mode in ("false", "true")], indent=2))
+
+
+if __name__ == "__main__":
+    main()
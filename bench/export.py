@@ -0,0 +1,69 @@
+"""Compare the legacy full-list path with the streaming export.
+
+Usage:
+    python bench/export.py --rows 1000000
+    DATABASE_URL=postgresql://... python bench/export.py --rows 1000000 --no-seed
+
+Without DATABASE_URL a throwaway SQLite file is used as a stand-in.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from common import seed
+from fastapi.encoders import jsonable_encoder
+
+from main import CocktailService, SessionLocal, export_rows
+
+
+def legacy():
+    db = SessionLocal()
+    try:
+        cocktails = CocktailService(db).get_all()
+        body = json.dumps(jsonable_encoder(cocktails))
+        yield body
+    finally:
+        db.close()
+
+
+def measure(name, chunks):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "path": name,
+        "first_byte_ms": round(first_byte * 1000, 2),
+        "total_s": round(total, 3),
+        "peak_mb": round(peak / 2**20, 1),
+        "bytes": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--no-seed", action="store_true", help="use the rows already in the database")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        print(f"Seeding {args.rows} rows...")
+        seed(args.rows)
+    results = [
+        measure("get_all + jsonable_encoder", legacy()),
+        measure("export ndjson", export_rows("ndjson", None, "id")),
+        measure("export csv", export_rows("csv", None, "id")),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Time IngredientIndex.match on a large synthetic recipe set.
+
+Usage:
+    python bench/makeable.py --recipes 100000
+"""
+import argparse
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import common  # noqa: F401  (puts the app on sys.path)
+
+from main import IngredientIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--ingredients", type=int, default=500, help="distinct ingredients")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = [f"ingredient {i}" for i in range(args.ingredients)]
+    index = IngredientIndex()
+    start = time.perf_counter()
+    index.load(
+        SimpleNamespace(id=i, name=f"Cocktail {i}", ingredients=", ".join(rng.sample(vocabulary, rng.randint(2, 8))))
+        for i in range(args.recipes)
+    )
+    build = time.perf_counter() - start
+
+    results = {"recipes": args.recipes, "build_s": round(build, 2)}
+    for max_missing in (0, 1, 2):
+        timings = []
+        for _ in range(args.queries):
+            have = rng.sample(vocabulary, 40)
+            start = time.perf_counter()
+            index.match(have, max_missing=max_missing, limit=50)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[f"max_missing_{max_missing}_p50_us"] = round(timings[len(timings) // 2] * 1e6, 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
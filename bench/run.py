@@ -0,0 +1,194 @@
+"""Reproducible endpoint benchmarks with a JSON baseline.
+
+Seeds the database to each requested size, drives every endpoint in-process through
+httpx's ASGI transport at a fixed concurrency, and records throughput, latency
+percentiles and peak traced memory. Cold start is measured on fresh uvicorn processes:
+import time of the app module, time from spawn to the first successful response and to
+/readyz. With --compare the results are checked against a
+previous run and the script exits non-zero on regressions.
+
+Usage:
+    python bench/run.py --sizes 1000,10000 --output bench/baseline.json
+    python bench/run.py --sizes 1000,10000 --compare bench/baseline.json --tolerance 0.25
+
+Without DATABASE_URL a throwaway SQLite file is used as a stand-in.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import httpx
+from common import ROOT, make_cocktail, percentile, seed
+
+from main import app
+
+# Metric name -> direction in which a change is a regression
+REGRESSIONS = {"rps": "lower", "p50_ms": "higher", "p95_ms": "higher", "p99_ms": "higher", "peak_kb": "higher",
+               "import_ms": "higher", "first_response_ms": "higher", "ready_ms": "higher"}
+
+
+def scenarios(size):
+    names = [make_cocktail(i)["name"] for i in range(size)]
+    created = itertools.count()
+
+    def get_cocktails(client):
+        return client.get("/api/cocktails", params={"limit": 100})
+
+    def get_cocktail(client):
+        return client.get(f"/api/cocktails/{random.choice(names)}")
+
+    def create_cocktail(client):
+        return client.post("/api/cocktails/add", json=make_cocktail(size + next(created)))
+
+    return {"get_cocktails": get_cocktails, "get_cocktail": get_cocktail, "create_cocktail": create_cocktail}
+
+
+async def drive(client, request, total, concurrency):
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await request(client)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def measure(request, args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await drive(client, request, min(50, args.requests), args.concurrency)  # warm-up
+        latencies, errors, elapsed = await drive(client, request, args.requests, args.concurrency)
+
+        tracemalloc.start()
+        await drive(client, request, min(200, args.requests), 1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def wait_for(url, status=200, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url).status_code == status:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(url)
+
+
+def cold_start(args):
+    """Median import, first-response and readiness times of fresh server processes."""
+    samples = {"import_ms": [], "first_response_ms": [], "ready_ms": []}
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    base_url = f"http://127.0.0.1:{args.port}"
+    for _ in range(args.cold_starts):
+        imported = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        samples["import_ms"].append(float(imported.stdout) * 1000)
+
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=ROOT, env=dict(os.environ))
+        try:
+            first = wait_for(f"{base_url}/api/cocktails/{make_cocktail(0)['name']}")
+            ready = wait_for(f"{base_url}/readyz")
+        finally:
+            server.terminate()
+            server.wait()
+        samples["first_response_ms"].append((first - start) * 1000)
+        samples["ready_ms"].append((ready - start) * 1000)
+    return {name: round(statistics.median(values), 1) for name, values in samples.items()}
+
+
+async def run(args):
+    results = {}
+    for size in args.sizes:
+        seed(size)
+        async with app.router.lifespan_context(app):
+            for name, request in scenarios(size).items():
+                random.seed(0)
+                results[f"{name}@{size}"] = await measure(request, args)
+                print(f"{name}@{size}: {results[f'{name}@{size}']}", file=sys.stderr)
+        if args.cold_starts:
+            results[f"cold_start@{size}"] = cold_start(args)
+            print(f"cold_start@{size}: {results[f'cold_start@{size}']}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for key, metrics in baseline["results"].items():
+        current = results.get(key)
+        if current is None:
+            continue
+        for metric, direction in REGRESSIONS.items():
+            old, new = metrics.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (direction == "lower" and change < -tolerance) or (direction == "higher" and change > tolerance):
+                failures.append(f"{key} {metric}: {old} -> {new} ({change:+.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated table sizes")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint and size")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change before failing")
+    parser.add_argument("--cold-starts", type=int, default=3, help="server processes started per size (0 to skip)")
+    parser.add_argument("--port", type=int, default=8766, help="port for the cold start servers")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = asyncio.run(run(args))
+    report = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                 "requests": args.requests, "concurrency": args.concurrency},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(results, json.load(f), args.tolerance)
+        if failures:
+            print("Regressions beyond tolerance:\n  " + "\n  ".join(failures), file=sys.stderr)
+            sys.exit(1)
+        print("No regressions beyond tolerance.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
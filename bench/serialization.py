@@ -0,0 +1,56 @@
+"""Per-row serialization cost of list responses, before and after the orjson path.
+
+"before" is what FastAPI did for endpoints returning ORM instances: validate each
+CocktailDB through the `Cocktail` model, run jsonable_encoder and json.dumps. "after" is
+the current path: plain row tuples turned into dicts and encoded by orjson.
+
+Usage:
+    python bench/serialization.py --rows 10000
+"""
+import argparse
+import json
+import time
+
+import common  # noqa: F401  (puts the app on sys.path)
+import orjson
+from common import make_cocktail
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from main import COCKTAIL_FIELDS, Cocktail, CocktailDB
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = [dict(make_cocktail(i), id=i + 1) for i in range(args.rows)]
+    orm_rows = [CocktailDB(**row) for row in data]
+    tuples = [tuple(row[f] for f in COCKTAIL_FIELDS) for row in data]
+    adapter = TypeAdapter(list[Cocktail])
+
+    paths = {
+        "orm -> pydantic -> jsonable_encoder -> json": lambda: json.dumps(jsonable_encoder(
+            [Cocktail.model_validate(row, from_attributes=True) for row in orm_rows])),
+        "orm -> jsonable_encoder -> json": lambda: json.dumps(jsonable_encoder(orm_rows)),
+        "tuples -> TypeAdapter.dump_json": lambda: adapter.dump_json(
+            adapter.validate_python([dict(zip(COCKTAIL_FIELDS, row)) for row in tuples])),
+        "tuples -> orjson (current)": lambda: orjson.dumps([dict(zip(COCKTAIL_FIELDS, row)) for row in tuples]),
+    }
+    results = {name: round(timed(fn, args.repeat) / args.rows * 1e6, 2) for name, fn in paths.items()}
+    print(json.dumps({"rows": args.rows, "us_per_row": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
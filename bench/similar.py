@@ -0,0 +1,117 @@
+"""Time SimilarityIndex on a large synthetic catalog, against a pure-Python scan.
+
+Usage:
+    python bench/similar.py --cocktails 100000
+"""
+import argparse
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import common  # noqa: F401  (puts the app on sys.path)
+
+from main import SimilarityIndex, split_ingredients, text_terms
+
+
+def synthetic(count, rng, ingredients, words):
+    for i in range(count):
+        yield SimpleNamespace(
+            id=i, name=f"Cocktail {i}",
+            ingredients=", ".join(rng.sample(ingredients, rng.randint(2, 8))),
+            description=" ".join(rng.choices(words, k=rng.randint(5, 15))),
+            instructions=" ".join(rng.choices(words, k=rng.randint(8, 25))),
+        )
+
+
+def python_scan(rows, query, k):
+    """The per-request loop this index replaces: Jaccard overlap of ingredient and word sets."""
+    have, said = set(split_ingredients(query.ingredients)), set(text_terms(query.description, query.instructions))
+    scored = []
+    for row in rows:
+        if row.id == query.id:
+            continue
+        ingredients = set(split_ingredients(row.ingredients))
+        words = set(text_terms(row.description, row.instructions))
+        score = (0.7 * len(have & ingredients) / (len(have | ingredients) or 1)
+                 + 0.3 * len(said & words) / (len(said | words) or 1))
+        scored.append((score, row.id))
+    return sorted(scored, reverse=True)[:k]
+
+
+def array_bytes(features):
+    """Raw CSR rows plus the built matrices of one feature family."""
+    raw = sum(a.itemsize * len(a) for a in (features.indptr, features.indices, features.counts))
+    built = sum(a.nbytes for a in (features.idf, features.columns, features.column_rows, features.column_weights))
+    return raw + built
+
+
+def percentile(timings, p):
+    timings = sorted(timings)
+    return round(timings[min(int(len(timings) * p), len(timings) - 1)] * 1e3, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cocktails", type=int, default=100_000)
+    parser.add_argument("--ingredients", type=int, default=500, help="distinct ingredients")
+    parser.add_argument("--words", type=int, default=5000, help="distinct description and instruction words")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    ingredients = [f"ingredient {i}" for i in range(args.ingredients)]
+    words = [f"word{i}" for i in range(args.words)]
+    rows = list(synthetic(args.cocktails, rng, ingredients, words))
+
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    for row in rows:
+        index.add(row)
+    loaded = time.perf_counter()
+    index.build()
+    built = time.perf_counter()
+
+    timings = []
+    for _ in range(args.queries):
+        name = rows[rng.randrange(len(rows))].name
+        started = time.perf_counter()
+        index.similar(name, args.k)
+        timings.append(time.perf_counter() - started)
+
+    # Incremental: rows added since the build are scored from their raw counts
+    extra = list(synthetic(500, rng, ingredients, words))
+    started = time.perf_counter()
+    for i, row in enumerate(extra):
+        row.id, row.name = args.cocktails + i, f"Added {i}"
+        index.add(row)
+    added = time.perf_counter() - started
+    incremental = []
+    for _ in range(args.queries):
+        started = time.perf_counter()
+        index.similar(rows[rng.randrange(len(rows))].name, args.k)
+        incremental.append(time.perf_counter() - started)
+
+    scans = []
+    for _ in range(3):
+        query = rows[rng.randrange(len(rows))]
+        started = time.perf_counter()
+        python_scan(rows, query, args.k)
+        scans.append(time.perf_counter() - started)
+
+    print(json.dumps({
+        "cocktails": args.cocktails,
+        "add_s": round(loaded - start, 2),
+        "build_s": round(built - loaded, 2),
+        "arrays_mb": round(sum(array_bytes(features) for features in (index.ingredients, index.words)) / 2 ** 20, 1),
+        "query_p50_ms": percentile(timings, 0.5),
+        "query_p99_ms": percentile(timings, 0.99),
+        "add_one_us": round(added / len(extra) * 1e6, 1),
+        "query_with_500_added_p50_ms": percentile(incremental, 0.5),
+        "python_scan_p50_ms": percentile(scans, 0.5),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Bulk-load cocktails with Postgres COPY.
+
+Rows are streamed through `COPY ... FROM STDIN` into a temporary staging table and then
+merged into `cocktails` with a single `INSERT ... SELECT ... ON CONFLICT (name)`, so
+millions of rows load in seconds instead of one round trip per cocktail. The ingredient
+links of every merged cocktail are then rebuilt set-based in the same transaction.
+
+Usage:
+    python data/import_cocktails.py menu.csv partner.ndjson
+    python data/import_cocktails.py --synthetic 1000000 --seed 7
+    python data/import_cocktails.py menu.csv --on-conflict skip
+
+CSV files need a header row with name, description, ingredients and instructions columns.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from main import QUANTITY_PATTERN, get_engine  # noqa: E402
+
+COLUMNS = ("name", "description", "ingredients", "instructions")
+
+SPIRITS = ["Gin", "Vodka", "White rum", "Dark rum", "Tequila", "Mezcal", "Bourbon", "Rye whiskey", "Cognac", "Pisco"]
+MODIFIERS = ["Campari", "Sweet vermouth", "Dry vermouth", "Triple sec", "Maraschino", "Chartreuse", "Aperol",
+             "Lime juice", "Lemon juice", "Grapefruit juice", "Simple syrup", "Honey syrup", "Orgeat",
+             "Angostura bitters", "Orange bitters", "Soda water", "Ginger beer", "Mint", "Egg white", "Cream"]
+METHODS = ["Shake with ice and strain into a chilled glass.", "Stir with ice and strain over a large cube.",
+           "Build over ice and top up.", "Blend with crushed ice."]
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield tuple(row.get(column) or "" for column in COLUMNS)
+
+
+def read_ndjson(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                yield tuple(row.get(column) or "" for column in COLUMNS)
+
+
+def synthetic(count, seed):
+    """`count` reproducible cocktails: the same seed always yields the same rows."""
+    rng = random.Random(seed)
+    for i in range(count):
+        spirit = rng.choice(SPIRITS)
+        ingredients = [spirit] + rng.sample(MODIFIERS, rng.randint(1, 5))
+        yield (
+            f"{spirit} Synthetic {i:08d}",
+            f"A {spirit.lower()} cocktail with {', '.join(ingredients[1:]).lower()}",
+            ", ".join(ingredients),
+            rng.choice(METHODS),
+        )
+
+
+class CopyStream(io.RawIOBase):
+    """File-like view of row tuples as CSV, read by psycopg2's copy_expert in chunks."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+        self._buffer = b""
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text, lineterminator="\n")
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.count += 1
+            if self._text.tell() > 1 << 16:
+                self._buffer += self._flush()
+        self._buffer += self._flush()
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def _flush(self):
+        data = self._text.getvalue().encode()
+        self._text.seek(0)
+        self._text.truncate()
+        return data
+
+
+MERGE = {
+    "update": """
+        INSERT INTO cocktails (name, description, ingredients, instructions)
+        SELECT DISTINCT ON (name) name, description, ingredients, instructions
+        FROM cocktails_staging ORDER BY name, seq DESC
+        ON CONFLICT (name) DO UPDATE SET description = EXCLUDED.description,
+            ingredients = EXCLUDED.ingredients, instructions = EXCLUDED.instructions
+    """,
+    "skip": """
+        INSERT INTO cocktails (name, description, ingredients, instructions)
+        SELECT DISTINCT ON (name) name, description, ingredients, instructions
+        FROM cocktails_staging ORDER BY name, seq DESC
+        ON CONFLICT (name) DO NOTHING
+    """,
+}
+
+
+# Rebuilds ingredients / cocktail_ingredients for the ids in cocktails_merged, parsing each
+# comma-separated item like main.parse_ingredients (first occurrence of a name wins)
+PARSED = """
+    SELECT DISTINCT ON (cocktail_id, name) cocktail_id, position, name, quantity
+    FROM (
+        SELECT c.id AS cocktail_id, t.position,
+               lower(trim(regexp_replace(t.item, %(pattern)s, '', 'i'))) AS name,
+               nullif(trim((regexp_match(t.item, %(pattern)s, 'i'))[1]), '') AS quantity
+        FROM cocktails c
+        JOIN cocktails_merged m ON m.id = c.id
+        CROSS JOIN LATERAL regexp_split_to_table(c.ingredients, ',') WITH ORDINALITY AS t(item, position)
+    ) items
+    WHERE name <> ''
+    ORDER BY cocktail_id, name, position
+"""
+
+LINK = [
+    "DELETE FROM cocktail_ingredients WHERE cocktail_id IN (SELECT id FROM cocktails_merged)",
+    f"""
+        INSERT INTO ingredients (name) SELECT DISTINCT name FROM ({PARSED}) parsed
+        ON CONFLICT (name) DO NOTHING
+    """,
+    f"""
+        INSERT INTO cocktail_ingredients (cocktail_id, ingredient_id, position, quantity)
+        SELECT parsed.cocktail_id, i.id,
+               row_number() OVER (PARTITION BY parsed.cocktail_id ORDER BY parsed.position), parsed.quantity
+        FROM ({PARSED}) parsed JOIN ingredients i ON i.name = parsed.name
+    """,
+]
+
+
+def load(rows, on_conflict="update"):
+    """COPY `rows` into a staging table and merge them into cocktails in one transaction."""
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("COPY import needs PostgreSQL; set DATABASE_URL to a postgresql:// URL")
+    stream = CopyStream(rows)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE cocktails_staging (
+                seq bigserial, name text NOT NULL, description text, ingredients text, instructions text
+            ) ON COMMIT DROP
+        """)
+        start = time.perf_counter()
+        # CSV COPY reads an unquoted empty field as NULL; the API stores empty strings, so the
+        # optional columns keep them (an empty name still fails the NOT NULL)
+        cursor.copy_expert(
+            "COPY cocktails_staging (name, description, ingredients, instructions) FROM STDIN "
+            "WITH (FORMAT csv, FORCE_NOT_NULL (description, ingredients, instructions))",
+            stream,
+        )
+        copied = time.perf_counter()
+        cursor.execute("CREATE TEMP TABLE cocktails_merged (id integer PRIMARY KEY) ON COMMIT DROP")
+        cursor.execute(f"WITH merged AS ({MERGE[on_conflict]} RETURNING id) "
+                       "INSERT INTO cocktails_merged SELECT id FROM merged")
+        merged_rows = cursor.rowcount
+        if merged_rows:
+            for statement in LINK:
+                cursor.execute(statement, {"pattern": QUANTITY_PATTERN})
+            # Running API workers reload their in-memory catalog when the counter moves; upserts
+            # may rewrite existing rows, which workers only pick up with a full reload
+            rewrites = "rewrites + 1" if on_conflict == "update" else "rewrites"
+            cursor.execute(f"UPDATE catalog_version SET version = version + 1, rewrites = {rewrites}, "
+                           "row_count = (SELECT count(*) FROM cocktails) WHERE id = 1")
+        connection.commit()
+        merged = time.perf_counter()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return {
+        "rows": stream.count,
+        "merged": merged_rows,
+        "copy_s": round(copied - start, 2),
+        "merge_s": round(merged - copied, 2),
+        "rows_per_s": round(stream.count / max(merged - start, 1e-9)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help=".csv or .ndjson/.jsonl files")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N", help="also generate N synthetic cocktails")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for --synthetic")
+    parser.add_argument("--on-conflict", choices=sorted(MERGE), default="update",
+                        help="update existing cocktails with the imported values, or skip them")
+    args = parser.parse_args()
+    if not args.files and not args.synthetic:
+        parser.error("give at least one file or --synthetic N")
+
+    def rows():
+        for path in args.files:
+            yield from (read_csv(path) if path.endswith(".csv") else read_ndjson(path))
+        yield from synthetic(args.synthetic, args.seed)
+
+    stats = load(rows(), args.on_conflict)
+    print(f"Imported {stats['rows']} rows ({stats['merged']} inserted or updated) "
+          f"in {stats['copy_s']}s COPY + {stats['merge_s']}s merge: {stats['rows_per_s']} rows/s")
+
+
+if __name__ == "__main__":
+    main()
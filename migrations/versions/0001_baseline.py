@@ -0,0 +1,51 @@
+"""Baseline: cocktails and catalog_version
+
+Idempotent, so databases created by hand or by the former `create_all` at startup are
+adopted as they are and only gain what they are missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = ("to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '') "
+                 "|| ' ' || coalesce(instructions, ''))")
+INGREDIENT_ARRAY = r"regexp_split_to_array(lower(trim(ingredients)), '\s*,\s*')"
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("cocktails"):
+        op.create_table(
+            "cocktails",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("name", sa.String),
+            sa.Column("description", sa.Text),
+            sa.Column("ingredients", sa.Text),
+            sa.Column("instructions", sa.Text),
+        )
+        op.create_index("ix_cocktails_id", "cocktails", ["id"])
+        op.create_index("ix_cocktails_name", "cocktails", ["name"], unique=True)
+    if bind.dialect.name == "postgresql":
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_cocktails_search ON cocktails USING gin ({SEARCH_VECTOR})")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_cocktails_ingredients ON cocktails USING gin ({INGREDIENT_ARRAY})")
+    if not inspector.has_table("catalog_version"):
+        op.create_table(
+            "catalog_version",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("version", sa.BigInteger, nullable=False),
+        )
+        op.execute("INSERT INTO catalog_version (id, version) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table("catalog_version")
+    op.drop_table("cocktails")
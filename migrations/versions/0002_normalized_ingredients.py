@@ -0,0 +1,108 @@
+"""Normalized ingredients: ingredients and cocktail_ingredients
+
+Backfills both tables from the comma-separated `cocktails.ingredients` strings, which stay
+in place as the denormalized copy the API returns. Leading amounts ("2 oz Gin") go to
+`cocktail_ingredients.quantity`. The ingredient filter of /api/cocktails/search now uses
+these tables, so the GIN index on the split string is dropped.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Frozen copy of main.QUANTITY_PATTERN as of this revision
+QUANTITY_PATTERN = (r"^\s*(\d[\d./ ]*(?:oz|ml|cl|tsp|tbsp|dash(?:es)?|drops?|parts?|cups?|barspoons?|slices?|sprigs?)?"
+                    r"\.?)\s+")
+INGREDIENT_ARRAY = r"regexp_split_to_array(lower(trim(ingredients)), '\s*,\s*')"
+
+# One row per (cocktail, ingredient) with its 1-based position, first occurrence wins
+PARSED = """
+    SELECT DISTINCT ON (cocktail_id, name) cocktail_id, position, name, quantity
+    FROM (
+        SELECT c.id AS cocktail_id, t.position,
+               lower(trim(regexp_replace(t.item, :pattern, '', 'i'))) AS name,
+               nullif(trim((regexp_match(t.item, :pattern, 'i'))[1]), '') AS quantity
+        FROM cocktails c
+        CROSS JOIN LATERAL regexp_split_to_table(c.ingredients, ',') WITH ORDINALITY AS t(item, position)
+    ) items
+    WHERE name <> ''
+    ORDER BY cocktail_id, name, position
+"""
+
+
+def backfill_postgresql():
+    op.execute(sa.text(f"""
+        INSERT INTO ingredients (name) SELECT DISTINCT name FROM ({PARSED}) parsed
+        ON CONFLICT (name) DO NOTHING
+    """).bindparams(pattern=QUANTITY_PATTERN))
+    # Positions are renumbered densely after dropping empty and repeated items
+    op.execute(sa.text(f"""
+        INSERT INTO cocktail_ingredients (cocktail_id, ingredient_id, position, quantity)
+        SELECT parsed.cocktail_id, i.id,
+               row_number() OVER (PARTITION BY parsed.cocktail_id ORDER BY parsed.position), parsed.quantity
+        FROM ({PARSED}) parsed JOIN ingredients i ON i.name = parsed.name
+    """).bindparams(pattern=QUANTITY_PATTERN))
+
+
+def backfill_python(batch_size=1000):
+    bind = op.get_bind()
+    quantity = re.compile(QUANTITY_PATTERN, re.IGNORECASE)
+    ingredient_ids = {}
+    rows = bind.execute(sa.text("SELECT id, ingredients FROM cocktails ORDER BY id")).all()
+    for start in range(0, len(rows), batch_size):
+        links = []
+        for cocktail_id, ingredients in rows[start:start + batch_size]:
+            seen = {}
+            for item in (ingredients or "").split(","):
+                match = quantity.match(item)
+                name = (item[match.end():] if match else item).strip().lower()
+                if name and name not in seen:
+                    seen[name] = match.group(1).strip() if match else None
+            for position, (name, amount) in enumerate(seen.items(), start=1):
+                if name not in ingredient_ids:
+                    ingredient_ids[name] = bind.execute(
+                        sa.text("INSERT INTO ingredients (name) VALUES (:name) RETURNING id"), {"name": name}).scalar()
+                links.append({"cocktail_id": cocktail_id, "ingredient_id": ingredient_ids[name],
+                              "position": position, "quantity": amount})
+        if links:
+            bind.execute(sa.text("INSERT INTO cocktail_ingredients (cocktail_id, ingredient_id, position, quantity) "
+                                 "VALUES (:cocktail_id, :ingredient_id, :position, :quantity)"), links)
+
+
+def upgrade():
+    op.create_table(
+        "ingredients",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, nullable=False),
+    )
+    op.create_index("ix_ingredients_name", "ingredients", ["name"], unique=True)
+    op.create_table(
+        "cocktail_ingredients",
+        sa.Column("cocktail_id", sa.Integer, sa.ForeignKey("cocktails.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("ingredient_id", sa.Integer, sa.ForeignKey("ingredients.id"), primary_key=True),
+        sa.Column("position", sa.Integer, nullable=False),
+        sa.Column("quantity", sa.String),
+    )
+    op.create_index("ix_cocktail_ingredients_ingredient", "cocktail_ingredients", ["ingredient_id", "cocktail_id"])
+
+    if op.get_bind().dialect.name == "postgresql":
+        backfill_postgresql()
+        op.execute("DROP INDEX IF EXISTS ix_cocktails_ingredients")
+    else:
+        backfill_python()
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_cocktails_ingredients ON cocktails USING gin ({INGREDIENT_ARRAY})")
+    op.drop_table("cocktail_ingredients")
+    op.drop_table("ingredients")
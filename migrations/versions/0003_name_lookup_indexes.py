@@ -0,0 +1,30 @@
+"""Name lookup indexes: lower(name) and pg_trgm
+
+`lower(name)` serves case-insensitive lookups; the trigram GIN index serves "did you mean"
+suggestions while a worker's in-memory name index is still loading.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_cocktails_name_lower", "cocktails", [sa.text("lower(name)")])
+    if op.get_bind().dialect.name == "postgresql":
+        # A trusted extension since Postgres 13: the database owner can create it
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_cocktails_name_trgm ON cocktails USING gin (lower(name) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_cocktails_name_trgm")
+    op.drop_index("ix_cocktails_name_lower", table_name="cocktails")
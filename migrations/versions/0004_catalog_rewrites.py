@@ -0,0 +1,25 @@
+"""Catalog rewrite counter
+
+`catalog_version.rewrites` moves with `version` only when existing cocktails change, so
+workers can catch up with plain inserts by reading the rows past the highest id they hold.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("catalog_version", sa.Column("rewrites", sa.BigInteger, nullable=False, server_default="0"))
+
+
+def downgrade():
+    with op.batch_alter_table("catalog_version") as batch:
+        batch.drop_column("rewrites")
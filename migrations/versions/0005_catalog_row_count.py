@@ -0,0 +1,27 @@
+"""Catalog row count
+
+`catalog_version.row_count` is kept equal to the number of cocktails by every write, in the
+same transaction as the version bump. A worker catching up with inserts compares it with the
+rows it holds instead of counting the table.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("catalog_version", sa.Column("row_count", sa.BigInteger, nullable=False, server_default="0"))
+    op.execute("UPDATE catalog_version SET row_count = (SELECT count(*) FROM cocktails)")
+
+
+def downgrade():
+    with op.batch_alter_table("catalog_version") as batch:
+        batch.drop_column("row_count")
@@ -0,0 +1,63 @@
+"""Production entry point.
+
+    python server.py migrate   # one-shot schema step, run by Fly.io as the release command
+    python server.py           # serve with WEB_CONCURRENCY worker processes (default: one per CPU)
+
+Each worker fills its connection pool and loads the catalog as soon as it starts; /readyz
+answers 200 once that is done (WARMUP_BLOCKING=true delays accepting connections until then).
+On SIGTERM or SIGINT the workers stop accepting, finish in-flight requests for up to
+GRACEFUL_TIMEOUT seconds and close their database connections.
+
+A .env file in the working directory is loaded before the app is imported.
+"""
+import argparse
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+
+def worker_count():
+    configured = os.getenv("WEB_CONCURRENCY")
+    if configured:
+        return max(int(configured), 1)
+    try:
+        return max(len(os.sched_getaffinity(0)), 1)
+    except AttributeError:  # not available on macOS and Windows
+        return os.cpu_count() or 1
+
+
+def migrate():
+    from main import init_db
+
+    init_db()
+
+
+def serve(workers):
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "25")),
+        # X-Forwarded-For / X-Forwarded-Proto are only honored from these proxy addresses, and the client
+        # is the rightmost address they did not add; "*" takes the leftmost, which any client can write
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", nargs="?", choices=("serve", "migrate"), default="serve")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: WEB_CONCURRENCY or CPUs)")
+    args = parser.parse_args()
+    load_dotenv()
+    if args.command == "migrate":
+        migrate()
+    else:
+        serve(args.workers or worker_count())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import csv
+import io
+import os
+from unittest.mock import MagicMock, patch
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+from data import import_cocktails
+from data.import_cocktails import CopyStream, synthetic
+
+def read_all(stream, size):
+    """Drain `stream` in reads of `size` bytes, checking none returns more."""
+    chunks = []
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return chunks
+        assert len(chunk) <= size
+        chunks.append(chunk)
+
+def test_copy_stream_chunks():
+    """Test that reads of any size return the same CSV, across the internal 64 KiB flushes."""
+    rows = list(synthetic(3000, seed=1))
+    whole = CopyStream(rows).read()
+    assert len(whole) > 3 << 16
+    for size in (1, 1000, 1 << 16, 1 << 20):
+        stream = CopyStream(rows)
+        chunks = read_all(stream, size)
+        assert b''.join(chunks) == whole and stream.count == 3000
+    assert [tuple(row) for row in csv.reader(io.StringIO(whole.decode()))] == rows
+
+def test_copy_stream_escaping():
+    """Test that commas, quotes, newlines and non-ASCII text survive the CSV round trip."""
+    rows = [
+        ('Piña Colada', 'Rum, "cream" and pineapple', 'White rum, Coconut cream', 'Blend.\nServe, cold.'),
+        ('Tea', '', '', ''),
+        ('\\N', 'a backslash', ' leading space', 'trailing space '),
+    ]
+    data = CopyStream(rows).read().decode()
+    assert [tuple(row) for row in csv.reader(io.StringIO(data))] == rows
+    assert 'Tea,,,\n' in data
+
+def test_synthetic_deterministic():
+    """Test that a seed always yields the same rows, with unique names."""
+    rows = list(synthetic(500, seed=7))
+    assert rows == list(synthetic(500, seed=7))
+    assert rows != list(synthetic(500, seed=8))
+    assert len({name for name, _, _, _ in rows}) == 500
+    assert all(name.startswith(ingredients.split(', ')[0]) for name, _, ingredients, _ in rows)
+
+def test_load_keeps_empty_strings():
+    """Test that the COPY keeps empty optional fields as empty strings and bumps the catalog version."""
+    # Setup mock connection whose COPY drains the stream
+    copied = []
+    cursor = MagicMock(rowcount=1)
+    cursor.copy_expert.side_effect = lambda sql, stream: copied.append((sql, stream.read()))
+    engine = MagicMock()
+    engine.dialect.name = 'postgresql'
+    engine.raw_connection.return_value.cursor.return_value = cursor
+
+    with patch.object(import_cocktails, 'get_engine', return_value=engine):
+        stats = import_cocktails.load([('Tea', '', '', '')], on_conflict='skip')
+
+    sql, data = copied[0]
+    assert 'FORCE_NOT_NULL (description, ingredients, instructions)' in sql
+    assert data == b'Tea,,,\n'
+    assert stats['rows'] == 1 and stats['merged'] == 1
+    bump = cursor.execute.call_args_list[-1][0][0]
+    assert 'version = version + 1, rewrites = rewrites,' in bump and 'row_count' in bump
+    engine.raw_connection.return_value.commit.assert_called_once()
@@ -1,13 +1,29 @@
+import asyncio
+import gzip
+import json
 import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DataError, DBAPIError, OperationalError
 
 # Mock database engine before importing main
 os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
 with patch('sqlalchemy.create_engine') as mock_create_engine:
     mock_engine = MagicMock()
     mock_create_engine.return_value = mock_engine
-    from main import CocktailService, CocktailDB, CocktailBase
+    import main
+    from main import (AdmissionControl, AdmissionMiddleware, AsyncCocktailService, Catalog, CatalogSnapshot,
+                      CompressionMiddleware, CocktailService, CocktailDB, CocktailBase, DecayingAverage, Histogram,
+                      IngredientIndex, MetricsMiddleware, MISSING, ReplicaSet, ResponseCache, TimedQueuePool,
+                      TokenBucket, decode_cursor, encode_cursor, etag_matches, export_rows, json_response, make_etag,
+                      negotiate_encoding, not_modified, parse_fields, parse_ingredients, pool_options, pool_stats,
+                      render_metrics, request_queries, search_query, to_async_url)
 
 def test_get_all():
     """Test getting all cocktails."""
@@ -82,6 +98,7 @@ def test_create_cocktail():
     """Test creating a new cocktail."""
     # Setup mock session and service
     mock_session = MagicMock()
+    mock_session.execute.return_value.all.return_value = [('ingredient 1', 1), ('ingredient 2', 2)]
     
     new_cocktail = CocktailBase(
         name='New Cocktail',
@@ -96,6 +113,8 @@ def test_create_cocktail():
     mock_session.add.assert_called_once()
     mock_session.commit.assert_called_once()
     mock_session.refresh.assert_called_once()
+    # Normalized ingredient rows are written in the same transaction
+    assert [link['ingredient_id'] for link in mock_session.execute.call_args_list[2][0][1]] == [1, 2]
 
 def test_create_duplicate_cocktail():
     """Test creating a cocktail with duplicate name."""
@@ -118,4 +137,829 @@ def test_create_duplicate_cocktail():
     except HTTPException as e:
         assert e.status_code == 400
         assert e.detail == "Cocktail with name 'Existing Cocktail' already exists"
-        mock_session.rollback.assert_called_once() 
\ No newline at end of file
+        mock_session.rollback.assert_called_once()
+
+def test_get_page():
+    """Test keyset pagination with a field projection."""
+    # Setup mock session and service
+    mock_session = MagicMock()
+    mock_query = MagicMock()
+    mock_session.query.return_value = mock_query
+    mock_query.filter.return_value = mock_query
+    mock_query.order_by.return_value = mock_query
+    mock_query.limit.return_value = mock_query
+    mock_query.all.return_value = [(1, 'Mojito'), (2, 'Old Fashioned'), (3, 'Margarita')]
+
+    service = CocktailService(mock_session)
+    items, next_cursor = service.get_page(2, fields=['name'])
+
+    assert items == [{'id': 1, 'name': 'Mojito'}, {'id': 2, 'name': 'Old Fashioned'}]
+    assert decode_cursor(next_cursor, 'id') == 2
+    mock_session.query.assert_called_once_with(CocktailDB.id, CocktailDB.name)
+    mock_query.limit.assert_called_once_with(3)
+    mock_query.filter.assert_not_called()
+
+    # Last page: no extra row means no next cursor
+    mock_query.all.return_value = [(3, 'Margarita')]
+    items, next_cursor = service.get_page(2, cursor=next_cursor, fields=['name'])
+    assert items == [{'id': 3, 'name': 'Margarita'}]
+    assert next_cursor is None
+    mock_query.filter.assert_called_once()
+
+def test_get_page_invalid_input():
+    """Test rejecting unknown fields and malformed or mismatched cursors."""
+    service = CocktailService(MagicMock())
+
+    for call in (lambda: parse_fields('name,price'),
+                 lambda: service.get_page(10, cursor='not-a-cursor'),
+                 lambda: decode_cursor(encode_cursor('name', 'Mojito'), 'id')):
+        try:
+            call()
+            assert False, "Expected HTTPException"
+        except HTTPException as e:
+            assert e.status_code == 400
+
+def test_export_rows():
+    """Test streaming the table as NDJSON and CSV chunks."""
+    # Setup mock session returned by the export's own session factory
+    mock_session = MagicMock()
+    mock_result = MagicMock()
+    mock_session.execute.return_value = mock_result
+    partitions = [[(1, 'Mojito'), (2, 'Old Fashioned')], [(3, 'Margarita, Frozen')]]
+
+    with patch('main.SessionLocal', return_value=mock_session):
+        mock_result.partitions.return_value = iter(partitions)
+        chunks = list(export_rows('ndjson', ['name'], 'id', batch_size=2))
+        assert len(chunks) == 2
+        assert ''.join(chunks).splitlines()[1] == '{"id":2,"name":"Old Fashioned"}'
+
+        mock_result.partitions.return_value = iter(partitions)
+        csv_text = ''.join(export_rows('csv', ['name'], 'id', batch_size=2))
+        assert csv_text.splitlines() == ['id,name', '1,Mojito', '2,Old Fashioned', '3,"Margarita, Frozen"']
+
+    statement = mock_session.execute.call_args[0][0]
+    assert statement.get_execution_options()['yield_per'] == 2
+    assert mock_session.close.call_count == 2
+
+def test_response_cache_lru_and_ttl():
+    """Test LRU eviction, TTL expiry and counters."""
+    cache = ResponseCache(maxsize=2, ttl=60, negative_ttl=0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+
+    assert cache.get('b') is MISSING
+    assert cache.get('c') == 3
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 1, 'evictions': 1}
+
+    with patch('main.time.monotonic', return_value=10**9):
+        assert cache.get('a') is MISSING
+
+def test_get_json_cached():
+    """Test read-through caching of serialized cocktails, negative caching and invalidation on create."""
+    # Setup mock session and service
+    mock_session = MagicMock()
+    mock_session.execute.return_value.first.side_effect = [
+        (1, 'Mojito', 'A refreshing Cuban highball', 'White rum, Sugar, Lime juice, Soda water, Mint',
+         'Muddle mint leaves with sugar and lime juice.'),
+        None,  # exact name
+        None,  # lower(name), before the name index is loaded
+    ]
+    mock_session.execute.return_value.all.return_value = [('white rum', 1), ('champagne', 2)]
+
+    service = CocktailService(mock_session, ResponseCache())
+    first = service.get_json('Mojito')
+    assert json.loads(first.body) == {
+        'id': 1, 'name': 'Mojito', 'description': 'A refreshing Cuban highball',
+        'ingredients': 'White rum, Sugar, Lime juice, Soda water, Mint',
+        'instructions': 'Muddle mint leaves with sugar and lime juice.',
+    }
+    assert service.get_json('Mojito') == first
+    assert first.etag.startswith('"')
+    for _ in range(2):
+        try:
+            service.get_json('Mojito Royale')
+            assert False, "Expected HTTPException"
+        except HTTPException as e:
+            assert e.status_code == 404
+    assert mock_session.execute.call_count == 3
+
+    service.create(CocktailBase(name='Mojito Royale', description='Mojito with champagne',
+                                ingredients='White rum, Champagne', instructions='Top with champagne.'))
+    assert service.cache.get('Mojito Royale') is MISSING
+
+def test_conditional_request():
+    """Test If-None-Match handling for strong and weak validators."""
+    etag = make_etag(42, 100, None, None, 'id')
+    assert etag == make_etag(42, 100, None, None, 'id')
+    assert etag != make_etag(43, 100, None, None, 'id')
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches(None, etag)
+
+    request = MagicMock()
+    request.headers = {'if-none-match': etag}
+    result = not_modified(request, etag)
+    assert result.status_code == 304
+    assert result.headers['etag'] == etag
+
+    request.headers = {'if-none-match': '"stale"'}
+    assert not_modified(request, etag) is None
+    response = json_response(b'{}', etag)
+    assert response.headers['etag'] == etag
+    assert 'max-age' in response.headers['cache-control']
+
+def test_async_service():
+    """Test the awaitable service front running the sync implementation."""
+    # Setup mock session and service
+    mock_session = MagicMock()
+    mock_query = MagicMock()
+    mock_filter = MagicMock()
+    mock_session.query.return_value = mock_query
+    mock_query.filter.return_value = mock_filter
+    mock_filter.first.return_value = CocktailDB(id=1, name='Mojito')
+
+    service = AsyncCocktailService(mock_session)
+    result = asyncio.run(service.get_by_name('Mojito'))
+
+    assert result.name == 'Mojito'
+    mock_session.query.assert_called_once_with(CocktailDB)
+
+def test_to_async_url():
+    """Test mapping sync database URLs onto their async drivers."""
+    assert to_async_url('postgresql://u:p@db:5432/x') == 'postgresql+asyncpg://u:p@db:5432/x'
+    assert to_async_url('postgresql+psycopg2://u:p@db/x') == 'postgresql+asyncpg://u:p@db/x'
+    assert to_async_url('sqlite:///bench.db') == 'sqlite+aiosqlite:///bench.db'
+
+def test_histogram():
+    """Test cumulative bucket counts."""
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'0.1': 2, '1.0': 3, '+Inf': 4}
+    assert snapshot['count'] == 4
+    assert round(snapshot['sum'], 6) == 3.65
+
+def test_pool_options_from_env():
+    """Test pool sizing from the environment."""
+    with patch.dict(os.environ, {'DB_POOL_SIZE': '20', 'DB_POOL_PRE_PING': 'false'}):
+        options = pool_options('postgresql://u:p@db/x')
+    assert options['pool_size'] == 20
+    assert options['max_overflow'] == 10
+    assert options['pool_pre_ping'] is False
+    assert options['poolclass'] is TimedQueuePool
+    assert pool_options('sqlite:///bench.db') == {}
+
+def test_timed_pool():
+    """Test checkout wait and timeout accounting on an exhausted pool."""
+    pool = TimedQueuePool(lambda: sqlite3.connect(':memory:'), pool_size=1, max_overflow=0, timeout=0.01)
+    waits, timeouts = main.pool_wait.count, main.pool_timeouts
+
+    connection = pool.connect()
+    assert pool_stats(pool)['checked_out'] == 1
+    try:
+        pool.connect()
+        assert False, "Expected pool timeout"
+    except Exception as e:
+        assert 'QueuePool limit' in str(e)
+    connection.close()
+
+    assert main.pool_wait.count == waits + 2
+    assert main.pool_timeouts == timeouts + 1
+    assert pool_stats(pool) == {'class': 'TimedQueuePool', 'size': 1, 'checked_out': 0, 'idle': 1,
+                                'overflow': 0, 'max_overflow': 0}
+
+def test_search_query():
+    """Test that search predicates use the indexed expressions."""
+    statement = search_query('rum sour', [' White Rum', 'Lime juice'], ['id', 'name'])
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    params = statement.compile(dialect=postgresql.dialect()).params
+
+    assert 'cocktails.id IN (SELECT cocktail_ingredients.cocktail_id' in sql
+    assert 'HAVING count(*) = %(count_1)s' in sql and params['count_1'] == 2
+    assert "@@ websearch_to_tsquery('english'" in sql
+    assert 'ORDER BY ts_rank(' in sql
+    assert params['name_1'] == ['lime juice', 'white rum']
+
+def test_search_pagination():
+    """Test offset cursors on ranked search results."""
+    # Setup mock session and service
+    mock_session = MagicMock()
+    mock_session.execute.return_value.all.return_value = [(4, 'Daiquiri'), (7, 'Mojito')]
+
+    service = CocktailService(mock_session)
+    items, next_cursor = service.search('rum', [], 1, fields=['name'])
+    assert items == [{'id': 4, 'name': 'Daiquiri'}]
+    assert decode_cursor(next_cursor, 'search') == 1
+
+    mock_session.execute.return_value.all.return_value = [(7, 'Mojito')]
+    items, next_cursor = service.search('rum', [], 1, cursor=next_cursor, fields=['name'])
+    assert items == [{'id': 7, 'name': 'Mojito'}]
+    assert next_cursor is None
+
+def test_ingredient_index_match():
+    """Test makeable matching ranked by missing-ingredient count."""
+    index = IngredientIndex()
+    index.load([
+        CocktailDB(id=1, name='Negroni', ingredients='Gin, Campari, Sweet vermouth, Orange peel'),
+        CocktailDB(id=2, name='Gimlet', ingredients='Gin, Lime juice, Simple syrup'),
+        CocktailDB(id=3, name='Daiquiri', ingredients='White rum, Lime juice, Simple syrup'),
+    ])
+
+    assert index.match(['Gin', 'lime juice ', 'Simple syrup']) == [
+        {'id': 2, 'name': 'Gimlet', 'missing': []},
+    ]
+    assert [r['name'] for r in index.match(['gin', 'lime juice', 'simple syrup'], max_missing=3)] == [
+        'Gimlet', 'Daiquiri', 'Negroni',
+    ]
+    assert index.match(['gin', 'campari'], max_missing=2, limit=1) == [
+        {'id': 1, 'name': 'Negroni', 'missing': ['sweet vermouth', 'orange peel']},
+    ]
+    assert index.match(['tequila'], max_missing=5) == []
+
+    # Kept in sync by CocktailService.create
+    mock_session = MagicMock()
+    mock_session.execute.return_value.all.return_value = [('gin', 1), ('lime juice', 2), ('soda water', 3)]
+    mock_session.add.side_effect = lambda row: setattr(row, 'id', 4)  # as the INSERT would
+    service = CocktailService(mock_session, catalog=Catalog([index]))
+    service.create(CocktailBase(name='Gin Rickey', description='Highball', ingredients='Gin, Lime juice, Soda water',
+                                instructions='Build over ice.'))
+    assert [r['name'] for r in index.match(['gin', 'lime juice', 'soda water'])] == ['Gin Rickey']
+
+    # A reload swapping in new lists while a query runs does not change its results
+    class SwapOnRelease:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            vars(index).update(ids=[], names=[], recipes=[])
+
+    index._lock = SwapOnRelease()
+    assert index.match(['gin', 'campari'], max_missing=2)[0]['name'] == 'Negroni'
+
+def test_bulk_create():
+    """Test batched ON CONFLICT inserts with per-item results."""
+    # Setup mock session returning the rows each INSERT ... RETURNING created, then the bumped version
+    mock_session = MagicMock()
+    mock_session.get_bind.return_value.dialect.name = 'postgresql'
+    mock_session.execute.side_effect = [
+        [SimpleNamespace(id=10, name='Mojito', ingredients='White rum, Mint')],
+        MagicMock(),
+        MagicMock(**{'all.return_value': [('white rum', 1), ('mint', 2)]}),
+        MagicMock(),
+        MagicMock(**{'scalar.return_value': 8}),
+        [SimpleNamespace(id=11, name='Gimlet', ingredients='Gin, Lime juice')],
+        MagicMock(),
+        MagicMock(**{'all.return_value': [('gin', 3), ('lime juice', 4)]}),
+        MagicMock(),
+        MagicMock(**{'scalar.return_value': 9}),
+    ]
+    cache = ResponseCache()
+    index = IngredientIndex()
+    catalog = Catalog([index])
+    catalog.version = 7
+    cocktails = [
+        CocktailBase(name=name, description='d', ingredients=ingredients, instructions='i')
+        for name, ingredients in [('Mojito', 'White rum, Mint'), ('Martini', 'Gin, Dry vermouth'),
+                                  ('Mojito', 'White rum, Mint'), ('Gimlet', 'Gin, Lime juice')]
+    ]
+
+    service = CocktailService(mock_session, cache, catalog)
+    results = service.bulk_create(cocktails, batch_size=2)
+
+    assert [r.id if r else None for r in results] == [10, None, None, 11]
+    assert mock_session.execute.call_count == 10
+    assert mock_session.commit.call_count == 2
+    assert mock_session.execute.call_args_list[8][0][1] == [
+        {'cocktail_id': 11, 'ingredient_id': 3, 'position': 1, 'quantity': None},
+        {'cocktail_id': 11, 'ingredient_id': 4, 'position': 2, 'quantity': None},
+    ]
+    statement = mock_session.execute.call_args_list[0][0][0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (name) DO NOTHING RETURNING' in sql
+    assert [r['name'] for r in index.match(['gin', 'lime juice'])] == ['Gimlet']
+    assert catalog.version == 9
+
+def test_name_index():
+    """Test normalized name resolution and trigram suggestions."""
+    assert main.normalize_name("Piña-Colada") == 'pina colada'
+    assert main.normalize_name("  Planter\u2019s   PUNCH ") == 'planters punch'
+
+    index = main.NameIndex()
+    catalog = Catalog([index])
+    catalog.load([SimpleNamespace(id=i, name=name) for i, name in
+                  enumerate(['Mojito', 'Old Fashioned', 'Piña Colada', 'Margarita', 'Old-fashioned'], start=1)], 1)
+
+    assert index.resolve('mojito') == 'Mojito'
+    assert index.resolve('pina colada') == 'Piña Colada'
+    assert index.resolve('Old-fashioned') == 'Old-fashioned'  # stored as is beats same normal form
+    assert index.resolve('OLD FASHIONED!') == 'Old Fashioned'
+    assert index.resolve('mojto') is None
+    assert index.suggest('mojto') == [{'id': 1, 'name': 'Mojito', 'score': 0.444}]
+    assert [s['name'] for s in index.suggest('old fashoned')] == ['Old Fashioned', 'Old-fashioned']
+    assert index.suggest('zzz') == [] and index.suggest('--') == []
+
+    catalog.written([SimpleNamespace(id=6, name='Mojito Royale')], 2)
+    assert index.resolve('mojito royale') == 'Mojito Royale'
+
+def test_get_json_resolves_names():
+    """Test lookups by a variant of the name and 404 suggestions, answered by the name index."""
+    index = main.NameIndex()
+    Catalog([index]).load([SimpleNamespace(id=1, name='Mojito')], 1)
+    mock_session = MagicMock()
+    mock_session.execute.return_value.first.side_effect = [(1, 'Mojito', 'd', 'i', 's'), None, None]
+
+    service = CocktailService(mock_session, ResponseCache(), names=index)
+    assert json.loads(service.get_json('MOJITO').body)['name'] == 'Mojito'
+    assert service.get_json('mojito') is service.cache.get('Mojito')
+    assert mock_session.execute.call_count == 1
+    try:
+        service.get_json('Mojto')
+        assert False, "Expected HTTPException"
+    except main.CocktailNotFound as e:
+        assert e.status_code == 404 and e.detail == "Cocktail 'Mojto' not found"
+        assert e.suggestions == [{'id': 1, 'name': 'Mojito', 'score': 0.444}]
+
+    # Repeated misses are answered from the cache, suggestions included, on both service fronts
+    async_service = AsyncCocktailService(service.db, service.cache, names=index)
+    with patch.object(index, 'suggest', wraps=index.suggest) as suggest:
+        for front in (service.get_json, lambda name: asyncio.run(async_service.get_json(name))):
+            for name in ('Mojto', 'Mojitto'):
+                try:
+                    front(name)
+                    assert False, "Expected HTTPException"
+                except main.CocktailNotFound as e:
+                    assert e.suggestions[0]['name'] == 'Mojito'
+    assert suggest.call_count == 1 and mock_session.execute.call_count == 3
+    assert index.suggest('mojito ' * 1000)[0]['name'] == 'Mojito'
+
+    # Before the index is loaded, suggestions come from pg_trgm
+    mock_session.get_bind.return_value.dialect.name = 'postgresql'
+    mock_session.execute.return_value = [(1, 'Mojito', 0.4444)]
+    assert CocktailService(mock_session).suggest('Mojto') == [{'id': 1, 'name': 'Mojito', 'score': 0.444}]
+    sql = str(mock_session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+    assert 'lower(cocktails.name) %% %(lower_1)s' in sql and 'ORDER BY similarity(' in sql
+
+def test_similarity_index():
+    """Test TF-IDF similarity ranking, incremental adds and the rebuild after too many of them."""
+    def cocktail(id, name, ingredients, description, instructions='Shake with ice and strain.'):
+        return SimpleNamespace(id=id, name=name, ingredients=ingredients, description=description,
+                               instructions=instructions)
+
+    index = main.SimilarityIndex()
+    catalog = Catalog([index])
+    catalog.load([
+        cocktail(1, 'Daiquiri', 'White rum, Lime juice, Simple syrup', 'A classic rum sour'),
+        cocktail(2, 'Gimlet', 'Gin, Lime juice, Simple syrup', 'A gin sour'),
+        cocktail(3, 'Mojito', 'White rum, Lime juice, Sugar, Mint, Soda water', 'A rum highball'),
+        cocktail(4, 'Negroni', 'Gin, Campari, Sweet vermouth', 'A bitter aperitivo'),
+        cocktail(5, 'Tea', '', '', None),
+    ], 1)
+
+    similar = index.similar('Daiquiri', k=3)
+    assert [s['name'] for s in similar] == ['Gimlet', 'Mojito', 'Negroni']
+    assert 1 > similar[0]['score'] > similar[1]['score'] > similar[2]['score'] > 0
+    assert [s['name'] for s in index.similar('Negroni', k=1)] == ['Gimlet']
+    assert index.similar('Tea') == [] and index.similar('Unknown') is None
+
+    # Added after the build: scored from raw counts, then folded into a rebuild
+    catalog.written([cocktail(6, 'Rum Gimlet', 'White rum, Lime juice, Simple syrup', 'A rum sour')], 2)
+    assert index.ingredients.rows == 5
+    assert index.similar('Daiquiri', k=1)[0]['name'] == 'Rum Gimlet'
+    assert index.similar('Rum Gimlet', k=1)[0]['name'] == 'Daiquiri'
+    with patch.object(main, 'SIMILAR_REBUILD_ROWS', 0):
+        rebuilt = index.similar('Daiquiri', k=2)
+    assert index.ingredients.rows == 6 and [s['name'] for s in rebuilt] == ['Rum Gimlet', 'Gimlet']
+
+    # While a rebuild runs, rows are still added and queries score them instead of waiting
+    with index._build_lock, patch.object(main, 'SIMILAR_REBUILD_ROWS', 0):
+        catalog.written([cocktail(7, 'Rum Sour', 'White rum, Lime juice, Simple syrup', 'A rum sour')], 3)
+        assert index.similar('Daiquiri', k=1)[0]['name'] in ('Rum Gimlet', 'Rum Sour')
+        assert index.ingredients.rows == 6
+
+def test_write_batcher():
+    """Test group commit: one bulk insert per batch, per-caller results and retries in halves on failure."""
+    calls = []
+    running = [0, 0]  # inserts in progress, most at once
+
+    class FakeService:
+        async def bulk_create(self, cocktails, batch_size):
+            calls.append([c.name for c in cocktails])
+            running[0] += 1
+            running[1] = max(running)
+            await asyncio.sleep(0)
+            running[0] -= 1
+            if 'Broken' in calls[-1]:
+                raise DataError('INSERT', {}, Exception('invalid byte sequence'))
+            if 'Down' in calls[-1]:
+                raise OperationalError('INSERT', {}, Exception('server closed the connection'))
+            if 'Gone' in calls[-1]:
+                raise DBAPIError('INSERT', {}, Exception('terminating connection'), connection_invalidated=True)
+            seen = set()
+            rows = []
+            for i, c in enumerate(cocktails):
+                duplicate = c.name in seen or c.name == 'Mojito'
+                seen.add(c.name)
+                rows.append(None if duplicate else SimpleNamespace(_mapping={'id': 100 + i, 'name': c.name}))
+            return rows
+
+    @asynccontextmanager
+    async def fake_scope():
+        yield FakeService()
+
+    def cocktail(name):
+        return CocktailBase(name=name, description='d', ingredients='i', instructions='i')
+
+    async def create_all(batcher, names):
+        return await asyncio.gather(*(batcher.create(cocktail(name)) for name in names), return_exceptions=True)
+
+    with patch.object(main, 'service_scope', fake_scope):
+        batcher = main.WriteBatcher(max_size=3, max_wait=0.01)
+        results = asyncio.run(create_all(batcher, ['Gimlet', 'Mojito', 'Gimlet', 'Daiquiri']))
+        assert calls == [['Gimlet', 'Mojito', 'Gimlet'], ['Daiquiri']]  # full batch at once, the rest after the wait
+        assert results[0] == {'id': 100, 'name': 'Gimlet'}
+        assert [r.status_code for r in results[1:3]] == [400, 400]
+        assert results[1].detail == "Cocktail with name 'Mojito' already exists"
+        assert results[3] == {'id': 100, 'name': 'Daiquiri'}
+
+        # A bad row is isolated by halving, one insert at a time, and fails like a single create
+        calls.clear()
+        batcher = main.WriteBatcher(max_size=4, max_wait=0.01)
+        results = asyncio.run(create_all(batcher, ['Negroni', 'Paloma', 'Broken', 'Sazerac']))
+        assert calls == [['Negroni', 'Paloma', 'Broken', 'Sazerac'], ['Negroni', 'Paloma'], ['Broken', 'Sazerac'],
+                         ['Broken'], ['Sazerac']]
+        assert [r['name'] for r in results[:2]] + [results[3]['name']] == ['Negroni', 'Paloma', 'Sazerac']
+        assert results[2].status_code == 400 and running[1] == 1
+
+        # A lost connection is not retried, and fails every create as unavailable rather than a duplicate
+        calls.clear()
+        results = asyncio.run(create_all(batcher, ['Negroni', 'Down']))
+        assert calls == [['Negroni', 'Down']] and [r.status_code for r in results] == [503, 503]
+        assert results[0].headers['Retry-After'] == '1'
+        calls.clear()
+        results = asyncio.run(create_all(batcher, ['Negroni', 'Gone']))
+        assert calls == [['Negroni', 'Gone']] and [r.status_code for r in results] == [503, 503]
+
+def test_parse_ingredients():
+    """Test splitting ingredient strings into normalized names and quantities."""
+    assert parse_ingredients('2 oz White Rum, 1/2 oz lime juice,  Mint , 2 dashes Angostura bitters, mint') == [
+        ('white rum', '2 oz'), ('lime juice', '1/2 oz'), ('mint', None), ('angostura bitters', '2 dashes'),
+    ]
+    assert parse_ingredients('7up, Soda water') == [('7up', None), ('soda water', None)]
+    assert parse_ingredients(None) == [] and parse_ingredients(' , ') == []
+
+def test_ingredient_counts():
+    """Test ingredient usage counts from the normalized tables."""
+    # Setup mock session returning (name, count) rows
+    mock_session = MagicMock()
+    mock_session.execute.return_value = [('lime juice', 12), ('gin', 9)]
+
+    service = CocktailService(mock_session)
+    assert service.ingredient_counts('Li', limit=2) == [
+        {'name': 'lime juice', 'cocktails': 12}, {'name': 'gin', 'cocktails': 9},
+    ]
+    statement = mock_session.execute.call_args[0][0]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert 'JOIN cocktail_ingredients ON cocktail_ingredients.ingredient_id = ingredients.id' in sql
+    assert 'ORDER BY cocktails DESC, ingredients.name' in sql
+
+def test_bulk_create_rollback():
+    """Test that a rejected batch is retried in halves down to the bad row, and a lost connection re-raised."""
+    # Setup mock session: the batch and then its second half are rejected, the first half inserts
+    rejected = DataError("INSERT", {}, Exception("value too long for type character varying(100)\nDETAIL: x"))
+    mock_session = MagicMock()
+    mock_session.execute.side_effect = [
+        rejected,
+        [SimpleNamespace(id=10, name='Mojito', ingredients='')],
+        MagicMock(**{'scalar.return_value': 8}),
+        rejected,
+    ]
+    cocktails = [CocktailBase(name=name, description='d', ingredients='', instructions='i')
+                 for name in ('Mojito', 'Long')]
+
+    service = CocktailService(mock_session)
+    results = service.bulk_create(cocktails)
+
+    assert results[0].id == 10 and results[1] is rejected
+    assert mock_session.rollback.call_count == 2 and mock_session.commit.call_count == 1
+
+    # Setup mock session: the connection fails, which no retry would fix
+    mock_session = MagicMock()
+    mock_session.execute.side_effect = Exception("connection lost")
+
+    service = CocktailService(mock_session)
+    try:
+        service.bulk_create([CocktailBase(name='Mojito', description='d', ingredients='i', instructions='i')])
+        assert False, "Expected exception"
+    except Exception as e:
+        assert str(e) == "connection lost"
+    mock_session.rollback.assert_called_once()
+
+def test_catalog_snapshot():
+    """Test the pre-serialized catalog, its encodings and version tracking."""
+    snapshot = CatalogSnapshot()
+    catalog = Catalog([snapshot])
+    mojito = CocktailDB(id=1, name='Mojito', description='d', ingredients='i', instructions='s')
+    assert catalog.load([mojito], version=3) == 1
+    assert catalog.ready and catalog.version == 3
+
+    body, etag = snapshot.variant()
+    assert json.loads(body) == [{'id': 1, 'name': 'Mojito', 'description': 'd', 'ingredients': 'i',
+                                 'instructions': 's'}]
+    compressed, gzip_etag = snapshot.variant('gzip')
+    assert gzip.decompress(compressed) == body
+    assert gzip_etag == etag[:-1] + '-gzip"'
+    assert snapshot.variant() is snapshot.variant()
+
+    # A local write advances the version; a gap (another worker wrote) leaves it for the watcher
+    catalog.written([CocktailDB(id=2, name='Gimlet', description='d', ingredients='i', instructions='s')], 4)
+    assert catalog.version == 4 and snapshot.variant()[1] != etag
+    assert len(json.loads(snapshot.variant()[0])) == 2
+    catalog.written([CocktailDB(id=4, name='Negroni', description='d', ingredients='i', instructions='s')], 6)
+    assert catalog.version == 4
+
+    # Compression runs unlocked: a write meanwhile is not blocked, and the stale result is not kept
+    def compress_during_write(body, encoding, best=False):
+        catalog.written([CocktailDB(id=5, name='Paloma', description='d', ingredients='i', instructions='s')], 7)
+        return gzip.compress(body)
+    with patch.object(main, 'compress', compress_during_write):
+        stale, _ = snapshot.variant('gzip')
+    assert len(json.loads(gzip.decompress(stale))) == 3
+    assert len(json.loads(gzip.decompress(snapshot.variant('gzip')[0]))) == 4
+
+    assert negotiate_encoding('gzip, deflate, br', ('br', 'gzip')) == 'br'
+    assert negotiate_encoding('br;q=0, gzip;q=0.5', ('br', 'gzip')) == 'gzip'
+    assert negotiate_encoding('*', ('gzip',)) == 'gzip'
+    assert negotiate_encoding(None, ('gzip',)) == 'identity'
+
+def test_catalog_reload():
+    """Test that reloads keep serving the previous models and that inserts are caught up incrementally."""
+    index = main.NameIndex()
+    catalog = Catalog([index])
+    catalog.load([SimpleNamespace(id=1, name='Mojito')], 1)
+    since = catalog.mark()
+
+    def rows():
+        # Reading rows may hand control to code that writes, as run_sync does on the event loop
+        catalog.written([SimpleNamespace(id=2, name='Gimlet')], 2)
+        assert catalog.ready and index.resolve('mojito') == 'Mojito'
+        yield SimpleNamespace(id=1, name='Mojito')
+    assert catalog.load(rows(), 1, since=since) == 1
+    assert catalog.ready and catalog.synced_id == 1 and index.names == ['Mojito', 'Gimlet']
+
+    # Another worker inserted id 4 while this one wrote id 3; rows already held are not added twice
+    catalog.written([SimpleNamespace(id=3, name='Negroni')], 4)
+    rows = [SimpleNamespace(id=2, name='Gimlet'), SimpleNamespace(id=3, name='Negroni'),
+            SimpleNamespace(id=4, name='Daiquiri')]
+    assert catalog.extend(rows) == 4
+    assert index.names == ['Mojito', 'Gimlet', 'Negroni', 'Daiquiri']
+    catalog.written([SimpleNamespace(id=4, name='Daiquiri')], 4)
+    assert catalog.size == 4 and catalog.version == 1
+
+    # Setup mock session: version 6 counts 5 rows, read joined to the one new id
+    mock_session = MagicMock()
+    mock_session.execute.return_value.scalar.return_value = 6
+    mock_session.execute.return_value.all.return_value = [
+        SimpleNamespace(version=6, rewrites=0, row_count=5, id=5, name='Paloma')]
+    service = CocktailService(mock_session, catalog=catalog)
+    assert service.sync_catalog() is True
+    assert catalog.version == 6 and index.resolve('paloma') == 'Paloma'
+
+    # A local write right after the version held leaves nothing to catch up
+    catalog.written([SimpleNamespace(id=6, name='Bramble')], 7)
+    assert catalog.version == 7 and catalog.synced_id == 6
+
+    # An insert committed below an id already read, or rewritten rows, need a full reload
+    mock_session.execute.return_value.scalar.return_value = 8
+    mock_session.execute.return_value.all.return_value = [
+        SimpleNamespace(version=8, rewrites=0, row_count=7, id=None, name=None)]
+    assert service.sync_catalog() is False
+    mock_session.execute.return_value.all.return_value = [
+        SimpleNamespace(version=9, rewrites=1, row_count=7, id=None, name=None)]
+    assert service.sync_catalog() is False
+    assert catalog.version == 7
+
+def test_compression_middleware():
+    """Test negotiation, the size threshold, reuse of compressed bodies and streaming."""
+    calls = []
+
+    def endpoint(chunks, headers):
+        async def app(scope, receive, send):
+            calls.append(scope['path'])
+            await send({'type': 'http.response.start', 'status': 200, 'headers': list(headers)})
+            for i, chunk in enumerate(chunks):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1})
+        return app
+
+    def request(app, accept='gzip'):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'path': '/', 'headers': [(b'accept-encoding', accept.encode())]}
+        asyncio.run(CompressionMiddleware(app, minimum_size=100, cache=ResponseCache())(scope, None, send))
+        headers = {k.decode(): v.decode() for k, v in sent[0]['headers']}
+        return headers, b''.join(m.get('body', b'') for m in sent[1:]), len(sent) - 1
+
+    body = json.dumps([{'name': f'Cocktail {i}'} for i in range(50)]).encode()
+    json_headers = [(b'content-type', b'application/json'), (b'etag', b'"abc"'),
+                    (b'content-length', str(len(body)).encode())]
+
+    headers, sent, _ = request(endpoint([body], json_headers))
+    assert headers['content-encoding'] == 'gzip' and headers['vary'] == 'Accept-Encoding'
+    assert headers['etag'] == 'W/"abc"' and int(headers['content-length']) == len(sent)
+    assert gzip.decompress(sent) == body
+
+    # Same ETag: the compressed bytes are reused
+    middleware = CompressionMiddleware(endpoint([body], json_headers), minimum_size=100, cache=ResponseCache())
+    for _ in range(2):
+        asyncio.run(middleware({'type': 'http', 'path': '/', 'headers': [(b'accept-encoding', b'gzip')]},
+                               None, lambda message: asyncio.sleep(0)))
+    assert middleware.cache.stats()['hits'] == 1
+
+    # Below the threshold, not negotiated, or already encoded: untouched
+    assert 'content-encoding' not in request(endpoint([b'{}'], json_headers[:1]))[0]
+    assert request(endpoint([body], json_headers), accept='identity')[1] == body
+    assert request(endpoint([b'xx'], [(b'content-type', b'application/json'),
+                                      (b'content-encoding', b'br')]))[1] == b'xx'
+
+    # Streamed: compressed chunk by chunk into one valid stream
+    lines = [b'{"id": %d}\n' % i for i in range(200)]
+    headers, sent, messages = request(endpoint(lines, [(b'content-type', b'application/x-ndjson')]))
+    assert headers['content-encoding'] == 'gzip' and 'content-length' not in headers
+    assert gzip.decompress(sent) == b''.join(lines) and messages == len(lines)
+
+def test_server_entry_point():
+    """Test worker count configuration and the serve / migrate commands."""
+    import server
+
+    with patch.dict(os.environ, {'WEB_CONCURRENCY': '3'}):
+        assert server.worker_count() == 3
+    with patch.dict(os.environ, {'WEB_CONCURRENCY': ''}):
+        assert server.worker_count() >= 1
+
+    with patch('uvicorn.run') as run, patch('sys.argv', ['server.py', '--workers', '2']):
+        server.main()
+    assert run.call_args[0] == ('main:app',)
+    assert run.call_args[1]['workers'] == 2 and run.call_args[1]['timeout_graceful_shutdown'] == 25
+    assert run.call_args[1]['forwarded_allow_ips'] == '127.0.0.1'
+
+    with patch('main.init_db') as init_db, patch('sys.argv', ['server.py', 'migrate']):
+        server.main()
+    init_db.assert_called_once()
+
+def test_lazy_engine():
+    """Test that engines are created on first use, once, and bound to sessions lazily."""
+    with patch.object(main, '_engines', {}), patch('main.create_engine') as create_engine:
+        session = main.SessionLocal()
+        create_engine.assert_not_called()
+        assert isinstance(session, main.RoutingSession)
+        assert session.get_bind() is main.get_engine() is main.get_engine()
+        create_engine.assert_called_once()
+
+def test_replica_routing():
+    """Test round-robin replica choice, statement routing and fallback to the primary."""
+    replica_set = ReplicaSet(['postgresql://replica-a/db', 'postgresql://replica-b/db'], retry_after=60)
+    assert [replica_set.choose() for _ in range(4)] == [0, 1, 0, 1]
+    replica_set.mark_down(0)
+    assert [replica_set.choose() for _ in range(3)] == [1, 1, 1]
+    replica_set.mark_down(1)
+    assert replica_set.choose() is None
+    replica_set.mark_up(0)
+
+    engines = {'sync': 'primary', 'replica:0': 'replica-a', 'replica:1': 'replica-b'}
+    with patch.object(main, 'replicas', replica_set), patch.object(main, '_engines', engines):
+        session = main.SessionLocal()
+        assert session.get_bind(clause=select(CocktailDB.id)) == 'replica-a'
+        assert session.get_bind(clause=select(CocktailDB.name)) == 'replica-a'  # sticky per session
+        assert session.get_bind(clause=update(CocktailDB).values(name='x')) == 'primary'
+
+        # A replica failing mid-request is marked down and the read retried on the primary
+        cached = main.CachedCocktail(b'{}', '"etag"')
+        error = OperationalError('SELECT', {}, Exception('server closed the connection'))
+        with patch.object(CocktailService, 'lookup_json', side_effect=[error, cached]):
+            assert asyncio.run(AsyncCocktailService(session).get_json('Mojito')) is cached
+        assert session.use_primary and replica_set.choose() is None
+
+        # Writes never touch a replica
+        session = main.SessionLocal()
+        with patch.object(CocktailService, 'create', return_value='created'):
+            asyncio.run(AsyncCocktailService(session).create(None))
+        assert session.get_bind(clause=select(CocktailDB.id)) == 'primary'
+
+    assert main.reads_from_primary(str(time.time() + 5))
+    assert not main.reads_from_primary(str(time.time() - 5)) and not main.reads_from_primary('junk')
+
+def test_token_bucket():
+    """Test token refill up to the burst size and the wait reported when empty."""
+    bucket = TokenBucket(rate=2, burst=3, now=0)
+    assert [bucket.take(0) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(0) == 0.5
+    assert bucket.take(0.5) == 0
+    bucket.take(100)
+    assert bucket.tokens == 2  # refilled to the burst, minus the token just taken
+
+def test_admission_middleware():
+    """Test per-client rate limiting, load shedding on pool waits and exempt paths."""
+    seen = []
+
+    async def endpoint(scope, receive, send):
+        seen.append(control.inflight)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'{}'})
+
+    def request(client='10.0.0.1', path='/api/cocktails', headers=(), client_header=b''):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'path': path, 'client': (client, 5000), 'headers': list(headers)}
+        asyncio.run(AdmissionMiddleware(endpoint, control, client_header)(scope, None, send))
+        return sent[0]['status'], dict(sent[0]['headers'])
+
+    pool_wait = DecayingAverage(halflife=60, weight=1)
+    control = AdmissionControl(per_client=1, burst=2, global_rate=0, max_pool_wait=0.1, min_inflight=1,
+                               max_inflight=0, pool_wait=pool_wait)
+    assert [request()[0] for _ in range(2)] == [200, 200]
+    status, headers = request()
+    assert status == 429 and headers[b'retry-after'] == b'1'
+    assert request(client='10.0.0.2')[0] == 200
+    assert seen == [1, 1, 1] and control.inflight == 0
+
+    # Contended pool: requests beyond min_inflight are shed, health checks still pass
+    pool_wait.observe(0.5)
+    assert request(client='10.0.0.3')[0] == 200
+    control.inflight = 1
+    status, headers = request(client='10.0.0.4')
+    assert status == 503 and headers[b'retry-after'] == b'1'
+    assert request(client='10.0.0.4', path='/readyz')[0] == 200
+    assert 'http_rejected_total{reason="pool_wait"} 1' in render_metrics()
+
+    # Behind the proxy, a client rotating X-Forwarded-For or sending its own address still has one bucket
+    control = AdmissionControl(per_client=1, burst=2, global_rate=0, max_pool_wait=0.1, min_inflight=1,
+                               max_inflight=0, pool_wait=DecayingAverage(halflife=60, weight=1))
+    statuses = [request(client='172.16.0.1', client_header=b'fly-client-ip', headers=[
+        (b'x-forwarded-for', f'192.0.2.{i}'.encode()), (b'fly-client-ip', b'203.0.113.7')])[0] for i in range(3)]
+    assert statuses == [200, 200, 429]
+    assert request(client='10.0.0.5', headers=[(b'fly-client-ip', b'203.0.113.8')])[0] == 200
+    assert request(client='10.0.0.5', headers=[(b'fly-client-ip', b'203.0.113.9')])[0] == 200
+    assert request(client='10.0.0.5', headers=[(b'fly-client-ip', b'203.0.113.10')])[0] == 429
+
+def test_health_endpoints():
+    """Test liveness and readiness while the catalog is loading and once it is loaded."""
+    assert asyncio.run(main.healthz()) == {'status': 'ok'}
+
+    loading = Catalog([IngredientIndex()])
+    with patch.object(main, 'catalog', loading):
+        response = main.Response()
+        assert asyncio.run(main.readyz(response)) == {'status': 'starting'}
+        assert response.status_code == 503
+
+        loading.load([], version=5)
+        response = main.Response()
+        assert asyncio.run(main.readyz(response)) == {'status': 'ready', 'catalog_version': 5}
+        assert response.status_code == 200
+
+def test_metrics_middleware():
+    """Test route metrics, the SQL statement budget and Prometheus rendering."""
+    async def endpoint(scope, receive, send):
+        scope['route'] = SimpleNamespace(path='/api/things/{name}')
+        request_queries.get()[0] += main.DB_QUERY_BUDGET + 1  # as the cursor hooks would
+        await send({'type': 'http.response.start', 'status': 201, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send(message):
+        pass
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/things/x'}
+    with patch.object(main.logger, 'warning') as warning:
+        asyncio.run(MetricsMiddleware(endpoint)(scope, None, send))
+    warning.assert_called_once()
+
+    text = render_metrics({'example_gauge': ('An example.', 3)})
+    assert 'http_requests_total{route="/api/things/{name}",method="POST",status="201"} 1' in text
+    assert 'http_request_duration_seconds_count{route="/api/things/{name}",method="POST"} 1' in text
+    assert 'db_query_budget_exceeded_total{route="/api/things/{name}"} 1' in text
+    assert '# TYPE example_gauge gauge\nexample_gauge 3' in text
+    assert request_queries.get() is None
+
+
+def test_sql_timing_failed_statement():
+    """Test that a failed statement leaves no timing state behind on its pooled connection."""
+    # Setup a real in-memory engine so the cursor hooks run
+    from sqlalchemy import create_engine, text
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        for _ in range(3):
+            try:
+                conn.execute(text('SELECT * FROM missing_table'))
+            except OperationalError:
+                pass
+        assert not isinstance(conn.info.get('query_start'), list)
+        assert conn.execute(text('SELECT 1')).scalar() == 1
+        assert 'query_start' not in conn.info